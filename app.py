@@ -1,7 +1,12 @@
+import math
 import os
+import threading
+from collections import defaultdict, deque
 from datetime import datetime, timedelta, date, time
 from flask import Flask, render_template, request, redirect, url_for, send_file, session, flash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -13,6 +18,11 @@ from reportlab.lib.units import mm
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "tajny_klic_pro_session")
 
+# Render má před aplikací jednu proxy; request.remote_addr pak vrací skutečnou IP klienta
+PROXY_HOPS = int(os.environ.get("PROXY_HOPS", "1"))
+if PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
 # Podpora Render/Postgres + lokální SQLite
 db_url = os.environ.get("DATABASE_URL", "")
 if db_url.startswith("postgres://"):
@@ -69,10 +79,13 @@ class User(db.Model):
         return FULL_NAMES.get(self.username, self.username)
 
     def set_password(self, pw: str):
-        self.password_hash = generate_password_hash(pw)
+        self.password_hash = hash_hesla(pw)
 
     def check_password(self, pw: str) -> bool:
-        return check_password_hash(self.password_hash, pw)
+        return over_heslo(self.password_hash, pw)
+
+    def needs_rehash(self) -> bool:
+        return self.password_hash.split("$", 1)[0] != HESLO_PREFIX
 
 
 class Akce(db.Model):
@@ -103,6 +116,14 @@ class Sklad(db.Model):
     datum = db.Column(db.DateTime, default=datetime.now)
 
 
+class StavSkladu(db.Model):
+    # aktuální zůstatek produktu (1 řádek / produkt); Sklad zůstává jako historie pohybů.
+    # verze slouží pro optimistické zamykání (compare-and-swap), každý produkt se zamyká zvlášť
+    produkt_id = db.Column(db.Integer, db.ForeignKey("produkt.id"), primary_key=True)
+    mnozstvi = db.Column(db.Float, nullable=False, default=0)
+    verze = db.Column(db.Integer, nullable=False, default=0)
+
+
 class AkceProdukt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     akce_id = db.Column(db.Integer, db.ForeignKey("akce.id"), nullable=False)
@@ -128,6 +149,278 @@ class Hodiny(db.Model):
     end = db.Column(db.DateTime, nullable=True)
     minuty = db.Column(db.Integer, default=0)
 
+
+# Šablony – opakovaně používaná sestava techniky a posádky
+class Sablona(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nazev = db.Column(db.String(200), nullable=False)
+    vytvoreno = db.Column(db.DateTime, default=datetime.now)
+
+
+class SablonaProdukt(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sablona_id = db.Column(db.Integer, db.ForeignKey("sablona.id"), nullable=False, index=True)
+    produkt_id = db.Column(db.Integer, db.ForeignKey("produkt.id"), nullable=False)
+    mnozstvi = db.Column(db.Float, nullable=False)
+
+    sablona = db.relationship("Sablona", backref="produkty")
+    produkt = db.relationship("Produkt")
+
+
+class SablonaZamestnanec(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sablona_id = db.Column(db.Integer, db.ForeignKey("sablona.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+
+# Archiv (studená data) – stejné sloupce jako provozní tabulky, jen pro čtení.
+# Archiv má vlastní id; SQLite bez AUTOINCREMENT po přesunu znovu přidělí nejvyšší
+# id, proto se původní id drží jen informativně v puvodni_id a akce_id v archivu
+# ukazuje na akce_archiv.id
+class AkceArchiv(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    puvodni_id = db.Column(db.Integer, nullable=False, index=True)
+    nazev = db.Column(db.String(200), nullable=False)
+    datum = db.Column(db.String(50), nullable=False)
+    cas_od = db.Column(db.String(10), nullable=True)
+    cas_do = db.Column(db.String(10), nullable=True)
+    misto = db.Column(db.String(200), nullable=False)
+    poznamka = db.Column(db.Text, nullable=True)
+    vytvoreno = db.Column(db.DateTime)
+    archivovano = db.Column(db.DateTime, default=datetime.now)
+
+
+class AkceProduktArchiv(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    puvodni_id = db.Column(db.Integer, nullable=False)
+    akce_id = db.Column(db.Integer, db.ForeignKey("akce_archiv.id"), nullable=False, index=True)
+    produkt_id = db.Column(db.Integer, db.ForeignKey("produkt.id"), nullable=False)
+    mnozstvi = db.Column(db.Float, nullable=False)
+
+    produkt = db.relationship("Produkt")
+
+
+class AkceZamestnanecArchiv(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    puvodni_id = db.Column(db.Integer, nullable=False)
+    akce_id = db.Column(db.Integer, db.ForeignKey("akce_archiv.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+
+
+class HodinyArchiv(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    puvodni_id = db.Column(db.Integer, nullable=False)
+    akce_id = db.Column(db.Integer, db.ForeignKey("akce_archiv.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    start = db.Column(db.DateTime, nullable=True)
+    end = db.Column(db.DateTime, nullable=True)
+    minuty = db.Column(db.Integer, default=0)
+
+
+class SkladArchiv(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    puvodni_id = db.Column(db.Integer, nullable=False)
+    produkt_id = db.Column(db.Integer, db.ForeignKey("produkt.id"), nullable=False)
+    akce_id = db.Column(db.Integer, db.ForeignKey("akce_archiv.id"), nullable=True, index=True)
+    typ = db.Column(db.String(50), nullable=False)
+    mnozstvi = db.Column(db.Float, nullable=False)
+    datum = db.Column(db.DateTime)
+
+# -----------------------------------------------------------------------------
+# SKLAD – zůstatky s optimistickým zamykáním po produktech
+# -----------------------------------------------------------------------------
+SKLAD_MAX_POKUSU = 5
+
+class NedostatekNaSkladu(Exception):
+    def __init__(self, produkt_id: int, pozadovano: float, k_dispozici: float):
+        self.produkt_id = produkt_id
+        self.pozadovano = pozadovano
+        self.k_dispozici = k_dispozici
+        super().__init__(f"produkt {produkt_id}: požadováno {pozadovano}, k dispozici {k_dispozici}")
+
+class KonfliktSkladu(Exception):
+    pass
+
+def soucet_pohybu(produkt_id: int) -> float:
+    # historie = provozní pohyby + archivované pohyby
+    total = 0.0
+    for tab in (Sklad, SkladArchiv):
+        n = db.session.query(db.func.sum(tab.mnozstvi)).filter_by(produkt_id=produkt_id, typ="naskladneni").scalar() or 0
+        v = db.session.query(db.func.sum(tab.mnozstvi)).filter_by(produkt_id=produkt_id, typ="vyskladneni").scalar() or 0
+        total += n - v
+    return float(total)
+
+def _nacti_stav(produkt_id: int):
+    # čte přímo z DB (ne z identity mapy session), aby retry viděl čerstvou verzi
+    q = db.select(StavSkladu.mnozstvi, StavSkladu.verze).where(StavSkladu.produkt_id == produkt_id)
+    row = db.session.execute(q).one_or_none()
+    if row is None:
+        # produkt bez řádku (např. založený mimo aplikaci) – dopočítat z historie
+        try:
+            with db.session.begin_nested():
+                db.session.add(StavSkladu(produkt_id=produkt_id, mnozstvi=soucet_pohybu(produkt_id)))
+        except IntegrityError:
+            pass  # mezitím ho založil souběžný požadavek
+        row = db.session.execute(q).one()
+    return row
+
+def stav_skladu(produkt_id: int) -> float:
+    return float(_nacti_stav(produkt_id).mnozstvi)
+
+def platne_mnozstvi(mnozstvi: float) -> bool:
+    return mnozstvi > 0 and math.isfinite(mnozstvi)
+
+def pohyb_skladu(produkt_id: int, typ: str, mnozstvi: float, akce_id=None):
+    # zapíše pohyb do historie a upraví zůstatek přes compare-and-swap na verzi;
+    # výdej nesmí jít do mínusu (NedostatekNaSkladu), při souběžné změně téhož
+    # produktu se opakuje, po SKLAD_MAX_POKUSU neúspěších vyhodí KonfliktSkladu
+    if not platne_mnozstvi(mnozstvi):
+        raise ValueError(f"neplatné množství {mnozstvi}")
+    _zmen_zustatek(produkt_id, mnozstvi if typ == "naskladneni" else -mnozstvi)
+    db.session.add(Sklad(produkt_id=produkt_id, akce_id=akce_id, typ=typ, mnozstvi=mnozstvi))
+
+def _zmen_zustatek(produkt_id: int, delta: float):
+    for _ in range(SKLAD_MAX_POKUSU):
+        stav = _nacti_stav(produkt_id)
+        if delta < 0 and stav.mnozstvi + delta < 0:
+            raise NedostatekNaSkladu(produkt_id, -delta, float(stav.mnozstvi))
+        try:
+            res = db.session.execute(
+                db.update(StavSkladu)
+                .where(StavSkladu.produkt_id == produkt_id, StavSkladu.verze == stav.verze)
+                .values(mnozstvi=StavSkladu.mnozstvi + delta, verze=StavSkladu.verze + 1)
+                .execution_options(synchronize_session=False)
+            )
+        except DBAPIError as e:
+            # deadlock / serializace (Postgres) nebo zamčená DB (SQLite) – transakce
+            # je pryč, volající musí rollbacknout; hlásí se jako konflikt
+            if _je_konflikt_db(e):
+                raise KonfliktSkladu(f"produkt {produkt_id}: souběžný zápis, zkus to znovu") from e
+            raise
+        if res.rowcount == 1:
+            return
+    raise KonfliktSkladu(f"produkt {produkt_id}: zůstatek se souběžně měnil, zkus to znovu")
+
+def _je_konflikt_db(e: DBAPIError) -> bool:
+    return getattr(e.orig, "pgcode", None) in ("40P01", "40001") or "database is locked" in str(e.orig)
+
+def zmen_zustatky(delty: dict):
+    # zámky řádků StavSkladu se berou vždy ve stejném pořadí (podle produkt_id),
+    # aby se souběžné transakce nad stejnými produkty nemohly zablokovat navzájem
+    for produkt_id in sorted(delty):
+        if delty[produkt_id]:
+            _zmen_zustatek(produkt_id, delty[produkt_id])
+
+def vydej_hromadne(radky: list):
+    # radky = [{"produkt_id", "akce_id", "mnozstvi"}, ...]; zůstatek se mění jednou
+    # za produkt (součet), pohyby se zapíší jedním hromadným INSERTem
+    delty = {}
+    for r in radky:
+        delty[r["produkt_id"]] = delty.get(r["produkt_id"], 0) - r["mnozstvi"]
+    zmen_zustatky(delty)
+    if radky:
+        ted = datetime.now()
+        db.session.execute(db.insert(Sklad), [dict(r, typ="vyskladneni", datum=ted) for r in radky])
+
+def chyba_skladu_text(e: Exception) -> str:
+    if isinstance(e, NedostatekNaSkladu):
+        p = db.session.get(Produkt, e.produkt_id)
+        nazev = p.nazev if p else f"#{e.produkt_id}"
+        return f"Nedostatek na skladě: {nazev} (požadováno {e.pozadovano:g}, k dispozici {e.k_dispozici:g})."
+    return "Sklad se mezitím změnil, zkus to prosím znovu."
+
+# -----------------------------------------------------------------------------
+# HESLA – omezený počet souběžných hashů + throttling přihlášení
+# -----------------------------------------------------------------------------
+# hashování je CPU náročné; najednou smí hashovat nejvýš HASH_WORKERS vláken
+# (výchozí WEB_THREADS - 1), takže aspoň jedno vlákno workeru zůstane volné pro
+# ostatní stránky. Další přihlášení chvíli (HASH_WAIT s) počká na volný slot,
+# teprve pak dostane 503. Hash běží přímo ve vlákně požadavku – hashlib uvolňuje
+# GIL, samostatný pool by jen přidal režii.
+HESLO_METODA = os.environ.get("PASSWORD_METHOD", "scrypt:32768:8:1")
+# werkzeug doplňuje výchozí parametry ("scrypt" -> "scrypt:32768:8:1"),
+# porovnává se proto s prefixem skutečně vygenerovaného hashe
+HESLO_PREFIX = generate_password_hash("", HESLO_METODA).split("$", 1)[0]
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "4"))  # procfile z něj bere --threads
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(max(1, WEB_THREADS - 1))))
+HASH_WAIT = float(os.environ.get("HASH_WAIT", "2"))
+
+# limity pokusů: (počet, okno v sekundách)
+LIMIT_IP = (int(os.environ.get("LOGIN_LIMIT_IP", "30")), 60)
+LIMIT_USER = (int(os.environ.get("LOGIN_LIMIT_USER", "5")), 300)
+
+_hash_sloty = threading.BoundedSemaphore(HASH_WORKERS)
+
+class PretizeniHesel(Exception):
+    pass
+
+def _se_slotem(fn, *args):
+    if not _hash_sloty.acquire(timeout=HASH_WAIT):
+        raise PretizeniHesel()
+    try:
+        return fn(*args)
+    finally:
+        _hash_sloty.release()
+
+def hash_hesla(pw: str) -> str:
+    return _se_slotem(generate_password_hash, pw, HESLO_METODA)
+
+def over_heslo(pw_hash: str, pw: str) -> bool:
+    return _se_slotem(check_password_hash, pw_hash, pw)
+
+class _Throttle:
+    # klouzavé okno v paměti procesu (každý gunicorn worker má vlastní);
+    # každých UKLID_PO zápisů se zahodí prošlé klíče a počet klíčů je omezen
+    # MAX_KLICU, aby smršť náhodných jmen/IP nezvětšovala paměť bez konce
+    UKLID_PO = 256
+    MAX_KLICU = 10000
+
+    def __init__(self, limit: int, okno: int):
+        self.limit, self.okno = limit, okno
+        self._pokusy = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._zapisu = 0
+
+    def _uklid(self, ted):
+        for klic in [k for k, q in self._pokusy.items() if not q or q[-1] <= ted - self.okno]:
+            del self._pokusy[klic]
+        # pořád moc klíčů – zahodit nejdéle založené (dict drží pořadí vložení),
+        # s rezervou 10 %, aby se úklid nespouštěl při každém dalším zápisu
+        nadbytek = len(self._pokusy) - self.MAX_KLICU * 9 // 10
+        for klic in list(self._pokusy)[:max(0, nadbytek)]:
+            del self._pokusy[klic]
+
+    def _procisti(self, q, ted):
+        while q and q[0] <= ted - self.okno:
+            q.popleft()
+
+    def blokovano(self, klic: str) -> bool:
+        ted = datetime.now().timestamp()
+        with self._lock:
+            q = self._pokusy.get(klic)
+            if not q:
+                return False
+            self._procisti(q, ted)
+            if not q:
+                del self._pokusy[klic]
+            return len(q) >= self.limit
+
+    def zapis(self, klic: str):
+        ted = datetime.now().timestamp()
+        with self._lock:
+            self._zapisu += 1
+            if self._zapisu % self.UKLID_PO == 0 or len(self._pokusy) >= self.MAX_KLICU:
+                self._uklid(ted)
+            q = self._pokusy[klic]
+            self._procisti(q, ted)
+            q.append(ted)
+
+    def vynuluj(self, klic: str):
+        with self._lock:
+            self._pokusy.pop(klic, None)
+
+throttle_ip = _Throttle(*LIMIT_IP)        # všechny pokusy z jedné IP
+throttle_user = _Throttle(*LIMIT_USER)    # neúspěšné pokusy na jeden účet
+
 # -----------------------------------------------------------------------------
 # INIT DB + výchozí uživatelé
 # -----------------------------------------------------------------------------
@@ -155,6 +448,10 @@ with app.app_context():
             u.set_password(pwd)
             db.session.add(u)
     db.session.commit()
+    # dopočet zůstatků pro produkty, které ještě nemají řádek ve stav_skladu
+    for p in Produkt.query.filter(~Produkt.id.in_(db.session.query(StavSkladu.produkt_id))).all():
+        db.session.add(StavSkladu(produkt_id=p.id, mnozstvi=soucet_pohybu(p.id)))
+    db.session.commit()
 
 # -----------------------------------------------------------------------------
 # CONTEXT pro šablony (current_user, now)
@@ -200,10 +497,6 @@ def require_role(*roles):
         return wrapper
     return deco
 
-def stav_skladu(produkt_id: int) -> float:
-    n = db.session.query(db.func.sum(Sklad.mnozstvi)).filter_by(produkt_id=produkt_id, typ="naskladneni").scalar() or 0
-    v = db.session.query(db.func.sum(Sklad.mnozstvi)).filter_by(produkt_id=produkt_id, typ="vyskladneni").scalar() or 0
-    return float(n - v)
 
 def round_to_half_hours(minutes: int) -> int:
     q, r = divmod(minutes, 30)
@@ -216,11 +509,20 @@ def parse_time(s: str) -> time:
     return datetime.strptime(s, "%H:%M").time()
 
 def vrat_produkty_a_smaz_vazby(akce: Akce):
-    for ap in AkceProdukt.query.filter_by(akce_id=akce.id).all():
+    # jen pro mazání akce – vrácení jde bez akce_id, protože akce zaniká
+    polozky = AkceProdukt.query.filter_by(akce_id=akce.id).all()
+    delty = {}
+    for ap in polozky:
+        delty[ap.produkt_id] = delty.get(ap.produkt_id, 0) + ap.mnozstvi
+    zmen_zustatky(delty)
+    for ap in polozky:
         db.session.add(Sklad(produkt_id=ap.produkt_id, akce_id=None, typ="naskladneni", mnozstvi=ap.mnozstvi))
     AkceProdukt.query.filter_by(akce_id=akce.id).delete()
 
 def uloz_produkty_k_akci(akce: Akce, form, produkty):
+    # stávající položky akce se vrátí a nové vyskladní jedním průchodem přes
+    # zmen_zustatky (rozdíl po produktech), aby se zámky braly ve stejném pořadí
+    nove = {}
     for p in produkty:
         key = f"produkt_{p.id}"
         if key in form and form[key]:
@@ -228,9 +530,22 @@ def uloz_produkty_k_akci(akce: Akce, form, produkty):
                 qty = float(form[key])
             except ValueError:
                 qty = 0.0
-            if qty > 0:
-                db.session.add(AkceProdukt(akce_id=akce.id, produkt_id=p.id, mnozstvi=qty))
-                db.session.add(Sklad(produkt_id=p.id, akce_id=akce.id, typ="vyskladneni", mnozstvi=qty))
+            if platne_mnozstvi(qty):
+                nove[p.id] = qty
+    stare = AkceProdukt.query.filter_by(akce_id=akce.id).all()
+    delty = {}
+    for ap in stare:
+        delty[ap.produkt_id] = delty.get(ap.produkt_id, 0) + ap.mnozstvi
+    for pid, qty in nove.items():
+        delty[pid] = delty.get(pid, 0) - qty
+    zmen_zustatky(delty)
+    # vrácení nese akce_id, aby se při archivaci přesunulo spolu s akcí
+    for ap in stare:
+        db.session.add(Sklad(produkt_id=ap.produkt_id, akce_id=akce.id, typ="naskladneni", mnozstvi=ap.mnozstvi))
+    AkceProdukt.query.filter_by(akce_id=akce.id).delete()
+    for pid, qty in nove.items():
+        db.session.add(Sklad(produkt_id=pid, akce_id=akce.id, typ="vyskladneni", mnozstvi=qty))
+        db.session.add(AkceProdukt(akce_id=akce.id, produkt_id=pid, mnozstvi=qty))
 
 def uloz_zamestnance_k_akci(akce: Akce, form):
     # šablony posílají checkboxy name="zamestnanci[]" value="<id>"
@@ -251,11 +566,32 @@ def login():
     if request.method == "POST":
         uname = request.form.get("username", "").strip()
         pw = request.form.get("password", "")
+        ip = request.remote_addr or ""
+        # throttling ještě před hashováním
+        if throttle_ip.blokovano(ip) or throttle_user.blokovano(uname.lower()):
+            flash("Příliš mnoho pokusů o přihlášení, zkus to za chvíli.", "error")
+            return render_template("login.html"), 429
         u = User.query.filter_by(username=uname, active=True).first()
-        if u and u.check_password(pw):
+        try:
+            ok = bool(u) and u.check_password(pw)
+        except PretizeniHesel:
+            # nepočítá se do limitu – heslo se vůbec neověřovalo
+            flash("Server je přetížený, zkus se přihlásit znovu.", "error")
+            return render_template("login.html"), 503
+        throttle_ip.zapis(ip)
+        if ok:
+            throttle_user.vynuluj(uname.lower())
+            if u.needs_rehash():
+                # přehashovat na aktuální parametry; když není volný slot, zkusí se příště
+                try:
+                    u.set_password(pw)
+                    db.session.commit()
+                except PretizeniHesel:
+                    pass
             session["user_id"] = u.id
             flash("Přihlášení OK.", "success")
             return redirect(url_for("index"))
+        throttle_user.zapis(uname.lower())
         flash("Neplatné přihlašovací údaje.", "error")
     return render_template("login.html")
 
@@ -317,7 +653,12 @@ def akce_nova():
             poznamka=request.form.get("poznamka", "")
         )
         db.session.add(a); db.session.flush()
-        uloz_produkty_k_akci(a, request.form, produkty)
+        try:
+            uloz_produkty_k_akci(a, request.form, produkty)
+        except (NedostatekNaSkladu, KonfliktSkladu) as e:
+            db.session.rollback()
+            flash(chyba_skladu_text(e), "error")
+            return redirect(url_for("akce_nova"))
         uloz_zamestnance_k_akci(a, request.form)
         db.session.commit()
         flash("Akce vytvořena a položky vyskladněny.", "success")
@@ -345,9 +686,13 @@ def akce_upravit(id):
         a.misto = request.form["misto"]
         a.poznamka = request.form.get("poznamka", "")
 
-        # produkty – vrátit a přepsat
-        vrat_produkty_a_smaz_vazby(a)
-        uloz_produkty_k_akci(a, request.form, produkty)
+        # produkty – vrátit a přepsat (jedním průchodem)
+        try:
+            uloz_produkty_k_akci(a, request.form, produkty)
+        except (NedostatekNaSkladu, KonfliktSkladu) as e:
+            db.session.rollback()
+            flash(chyba_skladu_text(e), "error")
+            return redirect(url_for("akce_upravit", id=id))
         # zaměstnanci
         uloz_zamestnance_k_akci(a, request.form)
 
@@ -390,13 +735,146 @@ def akce_detail(id):
 @require_role("admin", "manager")
 def akce_smazat(id):
     a = Akce.query.get_or_404(id)
-    vrat_produkty_a_smaz_vazby(a)
+    try:
+        vrat_produkty_a_smaz_vazby(a)
+    except KonfliktSkladu as e:
+        db.session.rollback()
+        flash(chyba_skladu_text(e), "error")
+        return redirect(url_for("akce_detail", id=id))
     AkceZamestnanec.query.filter_by(akce_id=a.id).delete()
     Hodiny.query.filter_by(akce_id=a.id).delete()
     db.session.delete(a); db.session.commit()
     flash("Akce smazána (položky vráceny, hodiny smazány).", "success")
     return redirect(url_for("index"))
 
+# -----------------------------------------------------------------------------
+# ŠABLONY + KLONOVÁNÍ AKCÍ (hromadné inserty v jedné transakci)
+# -----------------------------------------------------------------------------
+def zaloz_akce_hromadne(akce_data: list, polozky: list, zam_ids: list) -> list:
+    # akce_data = [{nazev, datum, cas_od, cas_do, misto, poznamka}, ...]
+    # polozky = [(produkt_id, mnozstvi), ...] – stejné pro každou novou akci
+    ted = datetime.now()
+    ids = db.session.execute(
+        db.insert(Akce).returning(Akce.id, sort_by_parameter_order=True),
+        [dict(d, vytvoreno=ted) for d in akce_data]
+    ).scalars().all()
+    ap = [{"akce_id": aid, "produkt_id": pid, "mnozstvi": qty} for aid in ids for pid, qty in polozky]
+    az = [{"akce_id": aid, "user_id": uid} for aid in ids for uid in zam_ids]
+    vydej_hromadne(ap)
+    if ap:
+        db.session.execute(db.insert(AkceProdukt), ap)
+    if az:
+        db.session.execute(db.insert(AkceZamestnanec), az)
+    return ids
+
+SERIE_MAX_POCET = 52
+SERIE_MAX_INTERVAL = 365
+
+def _cele_cislo(form, klic: str, vychozi: int, maximum: int, chyba: str) -> int:
+    try:
+        n = int(form.get(klic) or vychozi)
+    except ValueError:
+        raise ValueError(chyba)
+    if not 1 <= n <= maximum:
+        raise ValueError(chyba)
+    return n
+
+def akce_rada_z_formulare(form) -> list:
+    # první termín + volitelné opakování (pocet × interval dní, výchozí týdně);
+    # neplatné hodnoty vyhodí ValueError s hláškou pro uživatele
+    pocet = _cele_cislo(form, "pocet", 1, SERIE_MAX_POCET,
+                        f"Počet opakování musí být 1–{SERIE_MAX_POCET}.")
+    interval = _cele_cislo(form, "interval", 7, SERIE_MAX_INTERVAL,
+                           f"Interval opakování musí být 1–{SERIE_MAX_INTERVAL} dní.")
+    try:
+        prvni = parse_date(form["datum"])
+        data = [(prvni + timedelta(days=interval * i)).strftime("%Y-%m-%d") for i in range(pocet)]
+    except (ValueError, OverflowError):
+        raise ValueError("Neplatné datum.")
+    return [{
+        "nazev": form["nazev"],
+        "datum": d,
+        "cas_od": form.get("cas_od") or "",
+        "cas_do": form.get("cas_do") or "",
+        "misto": form["misto"],
+        "poznamka": form.get("poznamka", ""),
+    } for d in data]
+
+def _klonuj(zdroj, polozky, zam_ids, navrat):
+    if request.method == "POST":
+        try:
+            rada = akce_rada_z_formulare(request.form)
+        except ValueError as e:
+            flash(str(e), "error")
+            return redirect(navrat)
+        try:
+            ids = zaloz_akce_hromadne(rada, polozky, zam_ids)
+        except (NedostatekNaSkladu, KonfliktSkladu) as e:
+            db.session.rollback()
+            flash(chyba_skladu_text(e), "error")
+            return redirect(navrat)
+        db.session.commit()
+        flash(f"Vytvořeno akcí: {len(ids)} (položky vyskladněny).", "success")
+        return redirect(url_for("index"))
+    produkty = {p.id: p for p in Produkt.query.filter(Produkt.id.in_([pid for pid, _ in polozky])).all()}
+    return render_template(
+        "akce_klonovat.html",
+        zdroj=zdroj,
+        polozky=[(produkty[pid], qty) for pid, qty in polozky if pid in produkty],
+        jmena_zam=[u.jmeno for u in User.query.filter(User.id.in_(zam_ids)).order_by(User.username).all()]
+    )
+
+@app.route("/akce/<int:id>/klonovat", methods=["GET", "POST"])
+@login_required
+@require_role("admin", "manager")
+def akce_klonovat(id):
+    a = Akce.query.get_or_404(id)
+    polozky = [(ap.produkt_id, ap.mnozstvi) for ap in AkceProdukt.query.filter_by(akce_id=a.id).all()]
+    zam_ids = [z.user_id for z in AkceZamestnanec.query.filter_by(akce_id=a.id).all()]
+    return _klonuj(a, polozky, zam_ids, url_for("akce_klonovat", id=id))
+
+@app.route("/akce/<int:id>/ulozit-sablonu", methods=["POST"])
+@login_required
+@require_role("admin", "manager")
+def akce_ulozit_sablonu(id):
+    a = Akce.query.get_or_404(id)
+    s = Sablona(nazev=request.form.get("nazev", "").strip() or a.nazev)
+    db.session.add(s); db.session.flush()
+    db.session.add_all([SablonaProdukt(sablona_id=s.id, produkt_id=ap.produkt_id, mnozstvi=ap.mnozstvi)
+                        for ap in AkceProdukt.query.filter_by(akce_id=a.id).all()])
+    db.session.add_all([SablonaZamestnanec(sablona_id=s.id, user_id=z.user_id)
+                        for z in AkceZamestnanec.query.filter_by(akce_id=a.id).all()])
+    db.session.commit()
+    flash("Šablona uložena.", "success")
+    return redirect(url_for("sablony"))
+
+@app.route("/sablony")
+@login_required
+@require_role("admin", "manager")
+def sablony():
+    sablony_list = Sablona.query.order_by(Sablona.nazev).all()
+    return render_template("sablony.html", sablony=sablony_list)
+
+@app.route("/sablony/<int:id>/pouzit", methods=["GET", "POST"])
+@login_required
+@require_role("admin", "manager")
+def sablona_pouzit(id):
+    s = Sablona.query.get_or_404(id)
+    polozky = [(sp.produkt_id, sp.mnozstvi) for sp in s.produkty]
+    zam_ids = [z.user_id for z in SablonaZamestnanec.query.filter_by(sablona_id=s.id).all()]
+    return _klonuj(s, polozky, zam_ids, url_for("sablona_pouzit", id=id))
+
+@app.route("/sablony/<int:id>/smazat", methods=["POST"])
+@login_required
+@require_role("admin", "manager")
+def sablona_smazat(id):
+    s = Sablona.query.get_or_404(id)
+    SablonaProdukt.query.filter_by(sablona_id=s.id).delete()
+    SablonaZamestnanec.query.filter_by(sablona_id=s.id).delete()
+    db.session.delete(s); db.session.commit()
+    flash("Šablona smazána.", "success")
+    return redirect(url_for("sablony"))
+
 # -----------------------------------------------------------------------------
 # HODINY / DOCHÁZKA (přihlášení jen v den akce, start vázaný na čas akce)
 # -----------------------------------------------------------------------------
@@ -518,6 +996,135 @@ def hodiny_delete_by_akce(akce_id):
     flash("Hodiny pro akci smazány.", "success")
     return redirect(url_for("hodiny_overview"))
 
+# -----------------------------------------------------------------------------
+# ARCHIV – přesun starých uzavřených akcí do archivních tabulek
+# -----------------------------------------------------------------------------
+# akce starší než ARCHIV_DNY (podle data konání) bez běžícího záznamu hodin
+ARCHIV_DNY = int(os.environ.get("ARCHIV_DNY", "180"))
+ARCHIV_DNY_MIN, ARCHIV_DNY_MAX = 1, 36500
+
+ARCHIV_TABULKY = [
+    (AkceProdukt, AkceProduktArchiv),
+    (AkceZamestnanec, AkceZamestnanecArchiv),
+    (Hodiny, HodinyArchiv),
+    (Sklad, SkladArchiv),
+]
+
+def _kopiruj(src, dst, where, mapa=None):
+    # id -> puvodni_id, akce_id se přemapuje na id v akce_archiv
+    cols, vals = ["puvodni_id"], [src.__table__.c.id]
+    for c in src.__table__.columns:
+        if c.name == "id":
+            continue
+        cols.append(c.name)
+        vals.append(db.case(mapa, value=c) if mapa and c.name == "akce_id" else c)
+    return db.insert(dst).from_select(cols, db.select(*vals).where(where))
+
+def _smaz(src, where):
+    db.session.execute(db.delete(src).where(where).execution_options(synchronize_session=False))
+
+def archivuj_akce(starsi_nez_dni: int = ARCHIV_DNY) -> int:
+    # vše jedním během – INSERT ... SELECT + DELETE po tabulkách, commit dělá volající.
+    # Zůstatky ve StavSkladu se nemění, pohyby se jen přesouvají do SkladArchiv.
+    # Přesouvají se pohyby s akce_id; naskladnění bez akce a vrácení ze smazaných
+    # akcí (akce_id=None) zůstávají v provozní tabulce Sklad.
+    hranice = (date.today() - timedelta(days=starsi_nez_dni)).strftime("%Y-%m-%d")
+    bezici = db.select(Hodiny.akce_id).where(Hodiny.end == None)
+    ids = [r[0] for r in db.session.execute(
+        db.select(Akce.id).where(Akce.datum < hranice, Akce.id.not_in(bezici))
+    )]
+    if not ids:
+        return 0
+    # pořadí kvůli cizím klíčům: nejdřív rodič do archivu, na konci smazat z provozu
+    mapa = dict(db.session.execute(
+        _kopiruj(Akce, AkceArchiv, Akce.id.in_(ids)).returning(AkceArchiv.puvodni_id, AkceArchiv.id)
+    ).all())
+    for src, dst in ARCHIV_TABULKY:
+        db.session.execute(_kopiruj(src, dst, src.akce_id.in_(ids), mapa))
+        _smaz(src, src.akce_id.in_(ids))
+    _smaz(Akce, Akce.id.in_(ids))
+    db.session.expire_all()
+    return len(ids)
+
+@app.route("/archiv")
+@login_required
+@require_role("admin", "manager")
+def archiv():
+    akce = AkceArchiv.query.order_by(AkceArchiv.datum.desc()).all()
+    minuty = dict(db.session.query(HodinyArchiv.akce_id, db.func.sum(HodinyArchiv.minuty))
+                  .group_by(HodinyArchiv.akce_id).all())
+    hours = {a.id: (minuty.get(a.id) or 0) / 60.0 for a in akce}
+    return render_template("archiv.html", akce=akce, hours=hours, archiv_dny=ARCHIV_DNY)
+
+@app.route("/archiv/akce/<int:id>")
+@login_required
+@require_role("admin", "manager")
+def archiv_detail(id):
+    a = AkceArchiv.query.get_or_404(id)
+    polozky = AkceProduktArchiv.query.filter_by(akce_id=a.id).all()
+    prirazeni = db.session.query(User).join(AkceZamestnanecArchiv, User.id==AkceZamestnanecArchiv.user_id)\
+                .filter(AkceZamestnanecArchiv.akce_id==a.id).all()
+    hodiny = db.session.query(HodinyArchiv, User).join(User, HodinyArchiv.user_id==User.id)\
+             .filter(HodinyArchiv.akce_id==a.id).order_by(HodinyArchiv.start).all()
+    return render_template(
+        "archiv_detail.html",
+        akce=a,
+        polozky=polozky,
+        jmena_zam=[z.jmeno for z in prirazeni],
+        hodiny=hodiny
+    )
+
+@app.route("/archiv/spustit", methods=["POST"])
+@login_required
+@require_role("admin")
+def archiv_spustit():
+    try:
+        dni = int(request.form.get("dni") or ARCHIV_DNY)
+    except ValueError:
+        dni = 0
+    if not ARCHIV_DNY_MIN <= dni <= ARCHIV_DNY_MAX:
+        flash(f"Stáří akcí musí být {ARCHIV_DNY_MIN}–{ARCHIV_DNY_MAX} dní.", "error")
+        return redirect(url_for("archiv"))
+    n = archivuj_akce(dni)
+    db.session.commit()
+    flash(f"Archivováno akcí: {n}.", "success")
+    return redirect(url_for("archiv"))
+
+@app.route("/archiv/hodiny.pdf")
+@login_required
+@require_role("admin", "manager")
+def archiv_hodiny_pdf():
+    rows = db.session.query(HodinyArchiv, User, AkceArchiv)\
+        .join(User, HodinyArchiv.user_id==User.id)\
+        .join(AkceArchiv, HodinyArchiv.akce_id==AkceArchiv.id)\
+        .order_by(AkceArchiv.datum, User.username).all()
+    pdf_filename = "archiv_hodiny.pdf"
+    c = canvas.Canvas(pdf_filename, pagesize=A4)
+    w, h = A4
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(w/2, h-20*mm, "Archiv hodin")
+
+    y = h - 35*mm
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(20*mm, y, "Datum")
+    c.drawString(45*mm, y, "Akce")
+    c.drawString(120*mm, y, "Zaměstnanec")
+    c.drawRightString(w-20*mm, y, "Hodin")
+    y -= 7*mm
+    c.setFont("Helvetica", 11)
+    for hod, usr, a in rows:
+        if y < 20*mm:
+            c.showPage(); y = h - 20*mm; c.setFont("Helvetica", 11)
+        c.drawString(20*mm, y, a.datum)
+        c.drawString(45*mm, y, a.nazev[:40])
+        c.drawString(120*mm, y, usr.jmeno)
+        c.drawRightString(w-20*mm, y, f"{(hod.minuty or 0)/60.0:.1f}")
+        y -= 6*mm
+
+    c.save()
+    return send_file(pdf_filename, as_attachment=True)
+
 # -----------------------------------------------------------------------------
 # CHECKLIST PDF + alias pro odkaz v šablonách
 # -----------------------------------------------------------------------------
@@ -580,6 +1187,117 @@ def akce_checklist_pdf(id):
     c.save()
     return send_file(pdf_filename, as_attachment=True)
 
+# -----------------------------------------------------------------------------
+# NAKLÁDKA – souhrnný nakládací list za den / období (všechny akce najednou)
+# -----------------------------------------------------------------------------
+def nakladka_data(od: str, do: str):
+    # "stav" je volný zůstatek po vyskladnění; položky akcí se odepisují už při
+    # rezervaci a zůstatek nesmí do mínusu, takže nedostatek tu nastat nemůže
+    akce_list = Akce.query.filter(Akce.datum >= od, Akce.datum <= do)\
+                .order_by(Akce.datum, Akce.cas_od, Akce.id).all()
+    # jeden agregovaný dotaz: součet po (produkt, akce) + aktuální zůstatek
+    rows = db.session.query(
+        Produkt,
+        AkceProdukt.akce_id,
+        db.func.sum(AkceProdukt.mnozstvi).label("mnozstvi"),
+        StavSkladu.mnozstvi.label("stav")
+    ).join(AkceProdukt, AkceProdukt.produkt_id == Produkt.id)\
+     .join(Akce, AkceProdukt.akce_id == Akce.id)\
+     .outerjoin(StavSkladu, StavSkladu.produkt_id == Produkt.id)\
+     .filter(Akce.datum >= od, Akce.datum <= do)\
+     .group_by(Produkt.id, AkceProdukt.akce_id, StavSkladu.mnozstvi)\
+     .order_by(Produkt.nazev).all()
+
+    polozky = {}
+    for p, akce_id, qty, stav in rows:
+        if p.id not in polozky:
+            stav = float(stav) if stav is not None else stav_skladu(p.id)
+            polozky[p.id] = {"produkt": p, "celkem": 0.0, "akce": {}, "stav": stav}
+        polozky[p.id]["celkem"] += qty
+        polozky[p.id]["akce"][akce_id] = qty
+
+    poradi = SKUPINY + sorted({(i["produkt"].skupina or "ostatní") for i in polozky.values()} - set(SKUPINY))
+    skupiny = []
+    for skup in poradi:
+        items = [i for i in polozky.values() if (i["produkt"].skupina or "ostatní") == skup]
+        if items:
+            skupiny.append((skup, items))
+    nazvy = {a.id: a.nazev for a in akce_list}
+    return akce_list, skupiny, nazvy
+
+def _nakladka_obdobi():
+    od = request.args.get("od") or date.today().strftime("%Y-%m-%d")
+    do = request.args.get("do") or od
+    try:
+        parse_date(od); parse_date(do)
+    except ValueError:
+        od = do = date.today().strftime("%Y-%m-%d")
+    return od, do
+
+@app.route("/nakladka")
+@login_required
+@require_role("admin", "manager")
+def nakladka():
+    od, do = _nakladka_obdobi()
+    akce_list, skupiny, nazvy = nakladka_data(od, do)
+    return render_template("nakladka.html", od=od, do=do, akce_list=akce_list, skupiny=skupiny, nazvy=nazvy)
+
+@app.route("/nakladka.pdf")
+@login_required
+@require_role("admin", "manager")
+def nakladka_pdf():
+    od, do = _nakladka_obdobi()
+    akce_list, skupiny, nazvy = nakladka_data(od, do)
+    pdf_filename = f"nakladka_{od}_{do}.pdf"
+    c = canvas.Canvas(pdf_filename, pagesize=A4)
+    w, h = A4
+
+    logo = os.path.join(os.getcwd(), "static", "logo.png")
+    if os.path.exists(logo):
+        c.drawImage(logo, 20*mm, h-35*mm, width=45*mm, preserveAspectRatio=True, mask="auto")
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(w/2, h-30*mm, "Souhrnný nakládací list")
+    c.setFont("Helvetica", 11)
+    c.drawString(20*mm, h-45*mm, f"Období: {od}" + (f" – {do}" if do != od else ""))
+    c.drawString(20*mm, h-50*mm, f"Akce: {len(akce_list)}")
+
+    y = h - 60*mm
+    for a in akce_list:
+        if y < 30*mm:
+            c.showPage(); y = h - 20*mm; c.setFont("Helvetica", 11)
+        c.drawString(25*mm, y, f"{a.datum} {(a.cas_od or '')}  {a.nazev} – {a.misto}")
+        y -= 5*mm
+
+    y -= 5*mm
+    for skup, items in skupiny:
+        if y < 40*mm:
+            c.showPage(); y = h - 20*mm
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(20*mm, y, skup.upper())
+        c.drawRightString(w-50*mm, y, "Celkem")
+        c.drawRightString(w-20*mm, y, "Volně")
+        y -= 2*mm
+        c.line(20*mm, y, w-20*mm, y); y -= 5*mm
+        for i in items:
+            p = i["produkt"]
+            if y < 30*mm:
+                c.showPage(); y = h - 20*mm
+            c.setFont("Helvetica", 11)
+            c.rect(22*mm, y-3*mm, 4*mm, 4*mm, stroke=1, fill=0)
+            c.drawString(30*mm, y, p.nazev.upper())
+            c.drawRightString(w-50*mm, y, f"{int(i['celkem'])} {p.jednotka}")
+            c.drawRightString(w-20*mm, y, f"{i['stav']:g}")
+            y -= 5*mm
+            c.setFont("Helvetica", 9)
+            rozpad = ", ".join(f"{nazvy.get(aid, aid)}: {int(q)}" for aid, q in i["akce"].items())
+            c.drawString(34*mm, y, rozpad[:110])
+            y -= 6*mm
+        y -= 4*mm
+
+    c.save()
+    return send_file(pdf_filename, as_attachment=True)
+
 # -----------------------------------------------------------------------------
 # PRODUKTY & SKLAD
 # -----------------------------------------------------------------------------
@@ -602,7 +1320,8 @@ def edit_produkt(id):
         p.jednotka = request.form.get("jednotka", "ks").strip()
         p.skupina = request.form.get("skupina", "").strip()
         if id == 0:
-            db.session.add(p)
+            db.session.add(p); db.session.flush()
+            db.session.add(StavSkladu(produkt_id=p.id, mnozstvi=0))
         db.session.commit()
         flash("Produkt uložen.", "success")
         return redirect(url_for("produkty"))
@@ -614,10 +1333,13 @@ def edit_produkt(id):
 def delete_produkt(id):
     used_sklad = Sklad.query.filter_by(produkt_id=id).first()
     used_ap = AkceProdukt.query.filter_by(produkt_id=id).first()
-    if used_sklad or used_ap:
+    used_archiv = SkladArchiv.query.filter_by(produkt_id=id).first() or AkceProduktArchiv.query.filter_by(produkt_id=id).first()
+    if used_sklad or used_ap or used_archiv:
         flash("Produkt nelze smazat – je použit v akci nebo má skladové pohyby.", "error")
         return redirect(url_for("produkty"))
     p = Produkt.query.get_or_404(id)
+    StavSkladu.query.filter_by(produkt_id=id).delete()
+    SablonaProdukt.query.filter_by(produkt_id=id).delete()
     db.session.delete(p); db.session.commit()
     flash("Produkt smazán.", "success")
     return redirect(url_for("produkty"))
@@ -626,9 +1348,19 @@ def delete_produkt(id):
 @login_required
 def sklad():
     produkty_list = Produkt.query.order_by(Produkt.skupina, Produkt.nazev).all()
-    stav = {p.id: stav_skladu(p.id) for p in produkty_list}
+    stav = {r.produkt_id: float(r.mnozstvi) for r in StavSkladu.query.all()}
+    for p in produkty_list:
+        if p.id not in stav:
+            stav[p.id] = stav_skladu(p.id)
     return render_template("sklad.html", produkty=produkty_list, stav=stav, skupiny=SKUPINY)
 
+def _mnozstvi_z_formulare(form):
+    try:
+        mnozstvi = float(form.get("mnozstvi", ""))
+    except ValueError:
+        return None
+    return mnozstvi if platne_mnozstvi(mnozstvi) else None
+
 @app.route("/naskladnit", methods=["GET", "POST"])
 @login_required
 @require_role("admin", "manager")
@@ -636,8 +1368,16 @@ def naskladnit():
     produkty_list = Produkt.query.order_by(Produkt.skupina, Produkt.nazev).all()
     if request.method == "POST":
         produkt_id = int(request.form["produkt_id"])
-        mnozstvi = float(request.form["mnozstvi"])
-        db.session.add(Sklad(produkt_id=produkt_id, typ="naskladneni", mnozstvi=mnozstvi))
+        mnozstvi = _mnozstvi_z_formulare(request.form)
+        if mnozstvi is None:
+            flash("Množství musí být kladné číslo.", "error")
+            return redirect(url_for("naskladnit"))
+        try:
+            pohyb_skladu(produkt_id, "naskladneni", mnozstvi)
+        except KonfliktSkladu as e:
+            db.session.rollback()
+            flash(chyba_skladu_text(e), "error")
+            return redirect(url_for("naskladnit"))
         db.session.commit()
         flash("Naskladněno.", "success")
         return redirect(url_for("sklad"))
@@ -652,8 +1392,16 @@ def vyskladnit():
     if request.method == "POST":
         produkt_id = int(request.form["produkt_id"])
         akce_id = int(request.form.get("akce_id") or 0)
-        mnozstvi = float(request.form["mnozstvi"])
-        db.session.add(Sklad(produkt_id=produkt_id, akce_id=akce_id or None, typ="vyskladneni", mnozstvi=mnozstvi))
+        mnozstvi = _mnozstvi_z_formulare(request.form)
+        if mnozstvi is None:
+            flash("Množství musí být kladné číslo.", "error")
+            return redirect(url_for("vyskladnit"))
+        try:
+            pohyb_skladu(produkt_id, "vyskladneni", mnozstvi, akce_id=akce_id or None)
+        except (NedostatekNaSkladu, KonfliktSkladu) as e:
+            db.session.rollback()
+            flash(chyba_skladu_text(e), "error")
+            return redirect(url_for("vyskladnit"))
         db.session.commit()
         flash("Vyskladněno.", "success")
         return redirect(url_for("sklad"))
@@ -681,7 +1429,11 @@ def zamestnanec_set_password(id):
     if len(new_pw) < 4:
         flash("Heslo musí mít aspoň 4 znaky.", "error")
     else:
-        u.set_password(new_pw)
+        try:
+            u.set_password(new_pw)
+        except PretizeniHesel:
+            flash("Server je přetížený, zkus to znovu.", "error")
+            return redirect(url_for("zamestnanci"))
         db.session.commit()
         flash("Heslo změněno.", "success")
     return redirect(url_for("zamestnanci"))
@@ -0,0 +1,127 @@
+"""Benchmark: latence jiné stránky (/sklad) během hromadného přihlášení.
+
+Spustí aplikaci pod gunicornem stejně jako procfile (gthread, 4 vlákna) nad
+dočasnou SQLite, změří latenci /sklad naprázdno a během několika vln, kdy se
+celá posádka přihlásí naráz.
+Pro srovnání totéž s prakticky neomezeným počtem souběžných hashů (jako dřív,
+hashování přímo ve vlákně requestu).
+
+    python scripts/bench_login.py [--posadka 16] [--vln 5]
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+KOREN = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _post_login(port, jmeno, heslo):
+    c = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    body = urllib.parse.urlencode({"username": jmeno, "password": heslo})
+    c.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    r = c.getresponse(); r.read()
+    cookie = (r.getheader("Set-Cookie") or "").split(";", 1)[0]
+    c.close()
+    return r.status, cookie
+
+
+def _latence(port, cookie, pocet):
+    vysledky = []
+    c = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    for _ in range(pocet):
+        t = time.perf_counter()
+        c.request("GET", "/sklad", headers={"Cookie": cookie})
+        r = c.getresponse(); r.read()
+        vysledky.append((time.perf_counter() - t) * 1000)
+    c.close()
+    return vysledky
+
+
+def _souhrn(ms):
+    ms = sorted(ms)
+    return f"p50 {statistics.median(ms):7.1f} ms   p95 {ms[int(len(ms) * 0.95) - 1]:7.1f} ms   max {ms[-1]:7.1f} ms"
+
+
+def mereni(nazev, env_navic, posadka, vln, pozadavku, port):
+    tmp = tempfile.mkdtemp(prefix="bench_login_")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+               PROXY_HOPS="0", LOGIN_LIMIT_IP="1000000", **env_navic)
+    # DB + výchozí uživatele založit předem, ať se workery neperou o create_all
+    subprocess.run([sys.executable, "-c", "import app"], cwd=KOREN, env=env, check=True)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--worker-class", "gthread", "--threads", "4",
+         "-w", "1", "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=KOREN, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                status, cookie = _post_login(port, "admin", "admin123")
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("gunicorn nenaběhl")
+
+        klid = _latence(port, cookie, pozadavku)
+
+        kody = {}
+        zamek = threading.Lock()
+
+        def prihlaseni():
+            # kdo dostane 503, zkusí to za 0,5 s znovu jako člověk u prohlížeče
+            while True:
+                s, _ = _post_login(port, "david", "123456")
+                with zamek:
+                    kody[s] = kody.get(s, 0) + 1
+                if s != 503:
+                    return
+                time.sleep(0.5)
+
+        zatez, trvani = [], []
+        c = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        for _ in range(vln):
+            # celá posádka se přihlásí naráz; mezitím se průběžně ptáme na /sklad
+            t0 = time.perf_counter()
+            vlakna = [threading.Thread(target=prihlaseni) for _ in range(posadka)]
+            for t in vlakna:
+                t.start()
+            while any(t.is_alive() for t in vlakna):
+                t = time.perf_counter()
+                c.request("GET", "/sklad", headers={"Cookie": cookie})
+                r = c.getresponse(); r.read()
+                zatez.append((time.perf_counter() - t) * 1000)
+                time.sleep(0.02)
+            trvani.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.5)
+        c.close()
+
+        print(f"== {nazev}")
+        print(f"   /sklad naprázdno:        {_souhrn(klid)}")
+        print(f"   /sklad během vln ({posadka}):  {_souhrn(zatez)}   (n={len(zatez)})")
+        print(f"   přihlášení celé vlny:    {_souhrn(trvani)}")
+        print(f"   odpovědi /login:         {dict(sorted(kody.items()))}")
+    finally:
+        proc.terminate(); proc.wait()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--posadka", type=int, default=16, help="velikost posádky přihlašující se naráz")
+    ap.add_argument("--vln", type=int, default=5, help="kolikrát se posádka přihlásí")
+    ap.add_argument("--pozadavku", type=int, default=40, help="požadavků na /sklad naprázdno")
+    ap.add_argument("--port", type=int, default=8765)
+    a = ap.parse_args()
+    mereni("omezené hashování (výchozí nastavení)", {}, a.posadka, a.vln, a.pozadavku, a.port)
+    mereni("neomezené hashování (každé vlákno hashuje hned)",
+           {"HASH_WORKERS": "64"}, a.posadka, a.vln, a.pozadavku, a.port + 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# aplikace si DB zakládá při importu – testy běží nad dočasnou SQLite
+_tmp = tempfile.mkdtemp(prefix="ozvuceni_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplikace  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    # limity přihlášení se drží v paměti procesu – každý test začíná od nuly
+    aplikace.throttle_ip._pokusy.clear()
+    aplikace.throttle_user._pokusy.clear()
+    with aplikace.app.app_context():
+        yield aplikace
+        # úklid po testu – zůstávají jen výchozí uživatelé z inicializace aplikace
+        aplikace.db.session.rollback()
+        for tabulka in reversed(aplikace.db.metadata.sorted_tables):
+            if tabulka.name != "user":
+                aplikace.db.session.execute(tabulka.delete())
+        aplikace.db.session.commit()
+
+
+@pytest.fixture
+def nove_produkty(app):
+    def _vytvor(pocet: int, mnozstvi: float):
+        ids = []
+        for i in range(pocet):
+            p = app.Produkt(nazev=f"test {i}", skupina="repro")
+            app.db.session.add(p); app.db.session.flush()
+            app.db.session.add(app.StavSkladu(produkt_id=p.id, mnozstvi=0))
+            ids.append(p.id)
+        app.db.session.commit()
+        for pid in ids:
+            app.pohyb_skladu(pid, "naskladneni", mnozstvi)
+        app.db.session.commit()
+        return ids
+    return _vytvor
+
+
+@pytest.fixture
+def admin_client(app):
+    c = app.app.test_client()
+    c.post("/login", data={"username": "admin", "password": "admin123"})
+    return c
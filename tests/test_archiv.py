@@ -0,0 +1,71 @@
+from datetime import datetime
+
+
+def _stara_akce(app, produkt_id):
+    a = app.Akce(nazev="stará akce", datum="2000-01-01", misto="sklad")
+    app.db.session.add(a); app.db.session.flush()
+    app.pohyb_skladu(produkt_id, "vyskladneni", 1, akce_id=a.id)
+    app.db.session.add(app.AkceProdukt(akce_id=a.id, produkt_id=produkt_id, mnozstvi=1))
+    app.db.session.add(app.AkceZamestnanec(akce_id=a.id, user_id=1))
+    app.db.session.add(app.Hodiny(akce_id=a.id, user_id=1, start=datetime(2000, 1, 1, 8),
+                                  end=datetime(2000, 1, 1, 10), minuty=120))
+    app.db.session.commit()
+    return a.id
+
+
+def test_archivace_opakovane_se_znovu_pouzitym_id(app, nove_produkty):
+    (pid,) = nove_produkty(1, 5)
+    prvni = _stara_akce(app, pid)
+    assert app.archivuj_akce(30) == 1
+    app.db.session.commit()
+
+    # SQLite bez AUTOINCREMENT přidělí stejné id znovu
+    druha = _stara_akce(app, pid)
+    assert druha == prvni
+    assert app.archivuj_akce(30) == 1
+    app.db.session.commit()
+
+    archiv = app.AkceArchiv.query.all()
+    assert len(archiv) == 2
+    assert {a.puvodni_id for a in archiv} == {prvni}
+    for a in archiv:
+        assert app.AkceProduktArchiv.query.filter_by(akce_id=a.id).count() == 1
+        assert app.HodinyArchiv.query.filter_by(akce_id=a.id).count() == 1
+        assert app.SkladArchiv.query.filter_by(akce_id=a.id).count() == 1
+    assert app.Akce.query.count() == 0
+    assert app.Hodiny.query.count() == 0
+    assert app.AkceProdukt.query.count() == 0
+    # zůstatek se archivací nemění a sedí s historií včetně archivu
+    assert app.stav_skladu(pid) == 3
+    assert app.soucet_pohybu(pid) == 3
+
+
+def test_archivace_odmitne_neplatne_stari(app, admin_client):
+    a = app.Akce(nazev="dnešní akce", datum=datetime.now().strftime("%Y-%m-%d"), misto="sklad")
+    app.db.session.add(a); app.db.session.commit()
+    for dni in ["0", "-5", "1000000000", "abc"]:
+        r = admin_client.post("/archiv/spustit", data={"dni": dni}, follow_redirects=True)
+        assert r.status_code == 200
+        assert "Stáří akcí musí být" in r.get_data(as_text=True)
+    assert app.db.session.get(app.Akce, a.id) is not None
+
+
+def test_archivace_presune_i_vraceni_z_upravy_akce(app, nove_produkty):
+    p1, p2 = nove_produkty(2, 5)
+    a = app.Akce(nazev="upravovaná", datum="2000-02-01", misto="x")
+    app.db.session.add(a); app.db.session.flush()
+    produkty = [app.db.session.get(app.Produkt, pid) for pid in (p1, p2)]
+    app.uloz_produkty_k_akci(a, {f"produkt_{p1}": "2"}, produkty)
+    app.db.session.commit()
+    # úprava: p1 se vrátí, vyskladní se p2
+    app.uloz_produkty_k_akci(a, {f"produkt_{p2}": "1"}, produkty)
+    app.db.session.commit()
+
+    assert app.archivuj_akce(30) == 1
+    app.db.session.commit()
+    # v provozu zůstávají jen naskladnění bez akce
+    assert app.Sklad.query.filter(app.Sklad.akce_id != None).count() == 0
+    assert app.Sklad.query.count() == 2
+    assert app.SkladArchiv.query.count() == 3
+    assert [app.stav_skladu(p) for p in (p1, p2)] == [5, 4]
+    assert [app.soucet_pohybu(p) for p in (p1, p2)] == [5, 4]
@@ -0,0 +1,89 @@
+def test_podvrzeny_x_forwarded_for_neobejde_limit_ip(app):
+    c = app.app.test_client()
+    limit = app.throttle_ip.limit
+    kody = []
+    for i in range(limit + 5):
+        # klient podvrhne vlastní hodnotu, proxy připojí skutečnou adresu
+        r = c.post("/login", data={"username": f"nikdo{i}", "password": "x"},
+                   headers={"X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"})
+        kody.append(r.status_code)
+    assert kody[:limit] == [200] * limit
+    assert set(kody[limit:]) == {429}
+
+
+def test_throttle_zahazuje_prosle_a_omezuje_pocet_klicu(app):
+    t = app._Throttle(limit=3, okno=60)
+    t.MAX_KLICU = 100
+    for i in range(1000):
+        t.zapis(f"klic{i}")
+    assert len(t._pokusy) <= t.MAX_KLICU
+
+    t = app._Throttle(limit=3, okno=0)
+    for i in range(t.UKLID_PO):
+        t.zapis(f"klic{i}")
+    # okno 0 s – vše je okamžitě prošlé, úklid po UKLID_PO zápisech nechá jen poslední
+    assert len(t._pokusy) <= 1
+
+
+def test_prihlaseni_prehashuje_jen_zastaraly_hash(app, monkeypatch):
+    from werkzeug.security import generate_password_hash
+    u = app.User.query.filter_by(username="pavel").first()
+    u.password_hash = generate_password_hash("123456", method="pbkdf2:sha256:1000")
+    app.db.session.commit()
+    assert u.needs_rehash()
+
+    r = app.app.test_client().post("/login", data={"username": "pavel", "password": "123456"})
+    assert r.status_code == 302
+    app.db.session.expire_all()
+    u = app.User.query.filter_by(username="pavel").first()
+    assert not u.needs_rehash()
+
+    # holý název metody se normalizuje stejně jako ve werkzeug
+    monkeypatch.setattr(app, "HESLO_PREFIX", generate_password_hash("", "scrypt").split("$", 1)[0])
+    assert not u.needs_rehash()
+
+
+def test_soubezna_prihlaseni_pockaji_na_slot(app):
+    import threading
+    kody = []
+
+    def prihlas():
+        r = app.app.test_client().post("/login", data={"username": "david", "password": "123456"})
+        kody.append(r.status_code)
+
+    vlakna = [threading.Thread(target=prihlas) for _ in range(6)]
+    for v in vlakna:
+        v.start()
+    for v in vlakna:
+        v.join()
+    assert kody == [302] * 6
+
+
+def test_plny_pool_vrati_503_po_vyprseni_cekani(app, monkeypatch):
+    import time
+    monkeypatch.setattr(app, "HASH_WAIT", 0.2)
+    for _ in range(app.HASH_WORKERS):
+        app._hash_sloty.acquire()
+    try:
+        t = time.perf_counter()
+        r = app.app.test_client().post("/login", data={"username": "david", "password": "123456"})
+        assert r.status_code == 503
+        assert 0.2 <= time.perf_counter() - t < 1
+    finally:
+        for _ in range(app.HASH_WORKERS):
+            app._hash_sloty.release()
+
+
+def test_odmitnuti_pri_pretizeni_se_nepocita_do_limitu_ip(app, monkeypatch):
+    monkeypatch.setattr(app, "HASH_WAIT", 0.01)
+    c = app.app.test_client()
+    for _ in range(app.HASH_WORKERS):
+        app._hash_sloty.acquire()
+    try:
+        kody = [c.post("/login", data={"username": "david", "password": "123456"}).status_code
+                for _ in range(app.throttle_ip.limit + 5)]
+    finally:
+        for _ in range(app.HASH_WORKERS):
+            app._hash_sloty.release()
+    assert set(kody) == {503}
+    assert c.post("/login", data={"username": "david", "password": "123456"}).status_code == 302
@@ -0,0 +1,19 @@
+def test_nakladka_scita_po_produktech(app, admin_client, nove_produkty):
+    p1, p2 = nove_produkty(2, 10)
+    for nazev, qty in [("ranní", 2), ("večerní", 3)]:
+        a = app.Akce(nazev=nazev, datum="2031-05-05", misto="x")
+        app.db.session.add(a); app.db.session.flush()
+        for pid in (p1, p2):
+            app.pohyb_skladu(pid, "vyskladneni", qty, akce_id=a.id)
+            app.db.session.add(app.AkceProdukt(akce_id=a.id, produkt_id=pid, mnozstvi=qty))
+    app.db.session.commit()
+
+    akce_list, skupiny, nazvy = app.nakladka_data("2031-05-05", "2031-05-05")
+    assert sorted(nazvy.values()) == ["ranní", "večerní"]
+    polozky = {i["produkt"].id: i for _, items in skupiny for i in items}
+    assert polozky[p1]["celkem"] == 5 and polozky[p1]["stav"] == 5
+    assert sorted(polozky[p2]["akce"].values()) == [2, 3]
+
+    r = admin_client.get("/nakladka?od=2031-05-05")
+    assert r.status_code == 200
+    assert "ranní: 2" in r.get_data(as_text=True)
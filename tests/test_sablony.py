@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture
+def zdrojova_akce(app, nove_produkty):
+    (pid,) = nove_produkty(1, 100)
+    a = app.Akce(nazev="zdroj", datum="2030-01-01", misto="sál")
+    app.db.session.add(a); app.db.session.flush()
+    app.db.session.add(app.AkceProdukt(akce_id=a.id, produkt_id=pid, mnozstvi=1))
+    app.db.session.commit()
+    return a.id, pid
+
+
+def test_serie_vytvori_terminy_podle_intervalu(app, admin_client, zdrojova_akce):
+    aid, pid = zdrojova_akce
+    r = admin_client.post(f"/akce/{aid}/klonovat", data={
+        "nazev": "série", "datum": "2030-01-01", "misto": "sál", "pocet": "3", "interval": "7"})
+    assert r.status_code == 302
+    data = sorted(x.datum for x in app.Akce.query.filter_by(nazev="série").all())
+    assert data == ["2030-01-01", "2030-01-08", "2030-01-15"]
+    assert app.stav_skladu(pid) == 97
+
+
+@pytest.mark.parametrize("pole, hodnota, hlaska", [
+    ("interval", "1000000", "Interval opakování musí být"),
+    ("interval", "0", "Interval opakování musí být"),
+    ("interval", "týdně", "Interval opakování musí být"),
+    ("pocet", "53", "Počet opakování musí být"),
+    ("pocet", "-1", "Počet opakování musí být"),
+    ("pocet", "abc", "Počet opakování musí být"),
+])
+def test_serie_odmitne_neplatne_opakovani(app, admin_client, zdrojova_akce, pole, hodnota, hlaska):
+    aid, pid = zdrojova_akce
+    data = {"nazev": "série", "datum": "2030-01-01", "misto": "sál", "pocet": "3", "interval": "7"}
+    data[pole] = hodnota
+    r = admin_client.post(f"/akce/{aid}/klonovat", data=data, follow_redirects=True)
+    assert r.status_code == 200
+    assert hlaska in r.get_data(as_text=True)
+    assert app.Akce.query.filter_by(nazev="série").count() == 0
+    assert app.stav_skladu(pid) == 100
+
+
+def test_serie_s_datem_mimo_rozsah_nespadne(app, admin_client):
+    s = app.Sablona(nazev="prázdná")
+    app.db.session.add(s); app.db.session.commit()
+    r = admin_client.post(f"/sablony/{s.id}/pouzit", data={
+        "nazev": "konec", "datum": "9999-12-01", "misto": "x", "pocet": "5", "interval": "30"})
+    assert r.status_code == 302
+    assert app.Akce.query.filter_by(nazev="konec").count() == 0
+    r = admin_client.get(r.location)
+    assert "Neplatné datum." in r.get_data(as_text=True)
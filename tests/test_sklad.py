@@ -0,0 +1,124 @@
+import threading
+from collections import Counter
+
+import pytest
+
+
+def _soubezne_vydeje(app, produkty_vlaken, pocet_vydeju):
+    vysledky = Counter()
+    zamek = threading.Lock()
+
+    def writer(produkt_id):
+        with app.app.app_context():
+            for _ in range(pocet_vydeju):
+                try:
+                    app.pohyb_skladu(produkt_id, "vyskladneni", 1)
+                    app.db.session.commit()
+                    k = "ok"
+                except app.NedostatekNaSkladu:
+                    app.db.session.rollback(); k = "nedostatek"
+                except app.KonfliktSkladu:
+                    app.db.session.rollback(); k = "konflikt"
+                with zamek:
+                    vysledky[(produkt_id, k)] += 1
+
+    vlakna = [threading.Thread(target=writer, args=(pid,)) for pid in produkty_vlaken]
+    for t in vlakna:
+        t.start()
+    for t in vlakna:
+        t.join()
+    return vysledky
+
+
+def test_soubezne_vydeje_nejdou_do_mínusu(app, nove_produkty):
+    ids = nove_produkty(4, 10)
+    # 4 zapisovatelé na každý produkt, dohromady chtějí 4× víc, než je skladem
+    vysledky = _soubezne_vydeje(app, [ids[i % 4] for i in range(16)], 10)
+    app.db.session.expire_all()
+    for pid in ids:
+        assert vysledky[(pid, "ok")] == 10
+        assert app.stav_skladu(pid) == 0
+        assert app.soucet_pohybu(pid) == 0
+
+
+def test_jeden_zapisovatel_na_produkt_bez_konfliktu(app, nove_produkty):
+    ids = nove_produkty(8, 20)
+    # jeden zapisovatel na produkt – žádný compare-and-swap konflikt ani odmítnutí.
+    # Neověřuje, že se zápisy na různé produkty neblokují: SQLite zamyká pro zápis
+    # celou DB, řádkové zámky má až Postgres
+    vysledky = _soubezne_vydeje(app, ids, 15)
+    app.db.session.expire_all()
+    for pid in ids:
+        assert vysledky[(pid, "ok")] == 15
+        assert vysledky[(pid, "konflikt")] == 0
+        assert app.stav_skladu(pid) == 5
+
+
+def test_vydej_nad_stav_je_odmitnut(app, nove_produkty):
+    (pid,) = nove_produkty(1, 2)
+    with pytest.raises(app.NedostatekNaSkladu) as e:
+        app.pohyb_skladu(pid, "vyskladneni", 3)
+    assert e.value.k_dispozici == 2
+    app.db.session.rollback()
+    assert app.stav_skladu(pid) == 2
+
+
+def test_zamky_se_beru_podle_produkt_id(app, nove_produkty, monkeypatch):
+    ids = nove_produkty(4, 10)
+    a = app.Akce(nazev="pořadí", datum="2031-01-01", misto="x")
+    app.db.session.add(a); app.db.session.flush()
+    for pid in (ids[3], ids[1]):
+        app.pohyb_skladu(pid, "vyskladneni", 1, akce_id=a.id)
+        app.db.session.add(app.AkceProdukt(akce_id=a.id, produkt_id=pid, mnozstvi=1))
+    app.db.session.commit()
+
+    poradi = []
+    puvodni = app._zmen_zustatek
+    monkeypatch.setattr(app, "_zmen_zustatek", lambda pid, d: (poradi.append(pid), puvodni(pid, d)))
+    # formulář v obráceném pořadí než produkt_id – zámky přesto vzestupně
+    produkty = [app.db.session.get(app.Produkt, pid) for pid in reversed(ids)]
+    form = {f"produkt_{ids[0]}": "2", f"produkt_{ids[2]}": "1", f"produkt_{ids[3]}": "1"}
+    app.uloz_produkty_k_akci(a, form, produkty)
+    app.db.session.commit()
+    assert poradi == sorted(poradi)
+    assert ids[3] not in poradi  # beze změny množství se řádek nezamyká
+    assert [app.stav_skladu(pid) for pid in ids] == [8, 10, 9, 9]
+
+
+def test_deadlock_se_hlasi_jako_konflikt(app, nove_produkty, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    (pid,) = nove_produkty(1, 5)
+
+    class Deadlock(Exception):
+        pgcode = "40P01"
+
+    puvodni = app.db.session.execute
+
+    def execute(stmt, *args, **kwargs):
+        if getattr(stmt, "is_update", False):
+            raise OperationalError("UPDATE stav_skladu", {}, Deadlock("deadlock detected"))
+        return puvodni(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(app.db.session, "execute", execute)
+    with pytest.raises(app.KonfliktSkladu):
+        app.pohyb_skladu(pid, "vyskladneni", 1)
+    monkeypatch.undo()
+    app.db.session.rollback()
+    assert app.stav_skladu(pid) == 5
+
+
+@pytest.mark.parametrize("route", ["/naskladnit", "/vyskladnit"])
+@pytest.mark.parametrize("mnozstvi", ["-5", "0", "abc", "nan", "inf"])
+def test_neplatne_mnozstvi_je_odmitnuto(app, admin_client, nove_produkty, route, mnozstvi):
+    (pid,) = nove_produkty(1, 2)
+    r = admin_client.post(route, data={"produkt_id": pid, "mnozstvi": mnozstvi}, follow_redirects=True)
+    assert r.status_code == 200
+    assert "Množství musí být kladné číslo." in r.get_data(as_text=True)
+    assert app.stav_skladu(pid) == 2
+
+
+def test_pohyb_skladu_odmitne_zaporne_mnozstvi(app, nove_produkty):
+    (pid,) = nove_produkty(1, 2)
+    with pytest.raises(ValueError):
+        app.pohyb_skladu(pid, "vyskladneni", -5)
+    assert app.stav_skladu(pid) == 2